@@ -0,0 +1,467 @@
+# search_core.py
+# Shared data loading, filtering and chat routing for the Streamlit app.
+# Cached helpers live here so every page script reuses the same cache entries.
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import streamlit as st
+
+CSV_PATH = "Dimensions-Publication-2025-10-14_15-57-25.csv"
+
+# Expected column names
+COL_AUTHORS = "Authors"
+COL_TITLE   = "Title"
+COL_ABS     = "Abstract"
+MESH_CANDIDATES = ["MeSH terms", "MeSH_terms", "Mesh Terms", "Keywords", "Key Terms"]
+BLOB_KEY = "_blob"  # key of the combined keyword column in `search_columns`
+MESH_TOKENS_KEY = "_mesh_tokens"  # key of the pre-split MeSH term lists in `search_columns`
+AUTHOR_TOKENS_KEY = "_author_tokens"  # key of the pre-split author lists in `search_columns`
+SIG_BATCH_BYTES = 1 << 20  # text bytes hashed per batch in `_trigram_signatures`
+
+# Chat parsing patterns, compiled once at import
+TOP_N_RE = re.compile(r"\btop\s+(\d+)\b", re.IGNORECASE)
+FIRST_NUM_RE = re.compile(r"\b(\d+)\b")
+MENTIONING_RE = re.compile(r"mentioning\s+([A-Za-z0-9\-\s]+)")
+TAGGED_RE = re.compile(r"tagged\s+(.+)")
+
+# -------------------------------------------------
+# Data load
+# -------------------------------------------------
+@st.cache_data(show_spinner=False, persist="disk")
+def load_data(path: str, mtime: float) -> pd.DataFrame:
+    """
+    Read the CSV, going through a Parquet sidecar (`<path>.parquet`) when it is fresh.
+    `mtime` is the CSV's os.path.getmtime; it is only part of the cache key, so a replaced file is reloaded.
+    """
+    parquet_path = path + ".parquet"
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(path):
+        try:
+            return _with_arrow_strings(pd.read_parquet(parquet_path))
+        except Exception:
+            pass  # unreadable sidecar: fall through and rebuild it
+
+    df = _with_arrow_strings(_read_csv(path))
+    try:
+        df.to_parquet(parquet_path, compression="zstd", index=False)
+    except Exception:
+        pass  # sidecar is best-effort (read-only disk, unsupported dtypes, ...)
+    return df
+
+def _read_csv(path: str) -> pd.DataFrame:
+    """Parse with Arrow's multi-threaded CSV reader; fall back to pandas for files it can't decode."""
+    try:
+        # Dimensions exports have quoted multi-line cells (abstracts, affiliations)
+        table = pacsv.read_csv(path, parse_options=pacsv.ParseOptions(newlines_in_values=True))
+    except pa.ArrowInvalid:
+        table = None
+    # Arrow reads invalid UTF-8 as binary columns; pandas can drop the bad bytes instead
+    if table is None or any(pa.types.is_binary(f.type) for f in table.schema):
+        return pd.read_csv(path, encoding_errors="ignore")
+    return table.to_pandas()
+
+def _with_arrow_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Store the searchable text columns as pyarrow-backed strings so `.str` ops run in Arrow kernels."""
+    _, mesh_col = resolve_columns(df)
+    for col in [COL_AUTHORS, COL_TITLE, COL_ABS] + ([mesh_col] if mesh_col else []):
+        if col in df.columns:
+            df[col] = df[col].astype("string[pyarrow]")
+    return df
+
+def resolve_columns(df: pd.DataFrame) -> Tuple[List[str], Optional[str]]:
+    """Return (missing core columns, MeSH/keyword column or None)."""
+    missing = [c for c in [COL_AUTHORS, COL_TITLE, COL_ABS] if c not in df.columns]
+    mesh_col = next((c for c in MESH_CANDIDATES if c in df.columns), None)
+    return missing, mesh_col
+
+@st.cache_resource(show_spinner=False)
+def search_columns(path: str, mtime: float, mesh_col: Optional[str]) -> Dict[str, pd.Series]:
+    """
+    Search structures derived once from `load_data(path, mtime)`, keyed by column name or *_KEY:
+    the searchable text columns lowercased so filters can do plain substring scans,
+    BLOB_KEY: Title, Abstract and MeSH joined with a unit separator,
+    and MESH_TOKENS_KEY / AUTHOR_TOKENS_KEY: each row's MeSH terms / authors as list<string>
+    columns, split once and kept in the dataset's original casing for display.
+    Cached as a shared resource keyed on the file, not the frame, so reruns neither hash nor copy it;
+    treat the result as read-only.
+    """
+    df = load_data(path, mtime)
+    cols = [COL_AUTHORS, COL_TITLE, COL_ABS] + ([mesh_col] if mesh_col else [])
+    search_cols = {col: df[col].astype("string[pyarrow]").fillna("").str.lower() for col in cols}
+    # All keyword fields joined, so the default "search everywhere" case is a single scan
+    content = [search_cols[c] for c in cols[1:]]
+    search_cols[BLOB_KEY] = content[0].str.cat(content[1:], sep="\x1f")
+    search_cols[AUTHOR_TOKENS_KEY] = _split_terms(df[COL_AUTHORS])
+    if mesh_col:
+        search_cols[MESH_TOKENS_KEY] = _split_terms(df[mesh_col])
+    return search_cols
+
+def _split_terms(col: pd.Series) -> pd.Series:
+    """Split a "a; b; c" text column into a list<string> column of trimmed terms."""
+    text = pc.utf8_trim_whitespace(pa.array(col.fillna("").astype("string[pyarrow]"), type=pa.large_string()))
+    if isinstance(text, pa.ChunkedArray):
+        text = text.combine_chunks()
+    tokens = pc.split_pattern_regex(text, pattern=r"\s*;\s*")
+    return pd.Series(pd.arrays.ArrowExtensionArray(tokens), index=col.index)
+
+def _trigram_signatures(col: pd.Series) -> np.ndarray:
+    """
+    64-bit bloom signature per row: one bit set for each hashed UTF-8 byte trigram.
+    A needle can only occur in a row if all of the needle's bits are set in the row's signature.
+    """
+    arr = pa.array(col, type=pa.large_string())
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    n = len(arr)
+    sigs = np.zeros(n, dtype=np.uint64)
+    if n == 0 or arr.buffers()[2] is None:
+        return sigs
+
+    offsets = np.frombuffer(arr.buffers()[1], dtype=np.int64)[arr.offset : arr.offset + n + 1]
+    data = np.frombuffer(arr.buffers()[2], dtype=np.uint8)
+    # Hash about SIG_BATCH_BYTES of text at a time to bound the temporary arrays
+    lo = 0
+    while lo < n:
+        hi = int(np.searchsorted(offsets, offsets[lo] + SIG_BATCH_BYTES, side="right")) - 1
+        hi = min(max(hi, lo + 1), n)
+        sigs[lo:hi] = _batch_signatures(data, offsets[lo : hi + 1])
+        lo = hi
+    return sigs
+
+def _batch_signatures(data: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Signatures for the rows delimited by `offsets` (absolute positions into `data`)."""
+    start, end = offsets[0], offsets[-1]
+    sigs = np.zeros(len(offsets) - 1, dtype=np.uint64)
+    if end - start < 3:
+        return sigs
+
+    text = data[start:end]
+    grams = (text[:-2].astype(np.uint32) << 16) | (text[1:-1].astype(np.uint32) << 8) | text[2:]
+    bits = np.left_shift(np.uint64(1), ((grams * np.uint32(0x9E3779B1)) >> np.uint32(26)).astype(np.uint64))
+    bits = np.append(bits, np.zeros(2, dtype=np.uint64))
+
+    # Trigrams starting in a row's last two bytes straddle into the next row
+    ends = offsets[1:] - start
+    bits[ends[ends >= 1] - 1] = 0
+    bits[ends[ends >= 2] - 2] = 0
+    lengths = np.diff(offsets)
+    nonempty = np.flatnonzero(lengths)
+    sigs[nonempty] = np.bitwise_or.reduceat(bits, offsets[nonempty] - start)
+    return sigs
+
+@st.cache_resource(show_spinner=False)
+def trigram_signatures(path: str, mtime: float, mesh_col: Optional[str]) -> Dict[str, np.ndarray]:
+    """Bloom signatures for the keyword-searchable columns, used to skip rows before substring scans (read-only)."""
+    search_cols = search_columns(path, mtime, mesh_col)
+    cols = [COL_TITLE, COL_ABS] + ([mesh_col] if mesh_col else [])
+    sigs = {col: _trigram_signatures(search_cols[col]) for col in cols}
+    # Trigrams across the separator never occur in a needle, so the blob's signature is the union
+    sigs[BLOB_KEY] = np.bitwise_or.reduce([sigs[c] for c in cols])
+    return sigs
+
+# -------------------------------------------------
+# Filters
+# -------------------------------------------------
+def _contains(col: pd.Series, needle: str) -> np.ndarray:
+    """Literal substring test over a pre-lowered column using Arrow's match_substring kernel."""
+    hits = pc.match_substring(pa.array(col), needle)
+    return hits.to_numpy(zero_copy_only=False)
+
+def _any_contains(
+    cols: List[pd.Series],
+    needle: str,
+    rows: np.ndarray,
+    sigs: Optional[List[np.ndarray]] = None,
+) -> np.ndarray:
+    """
+    Row-wise OR of `_contains` over several pre-lowered columns, restricted to `rows` (positions).
+    Each column is only scanned on rows that no earlier column matched,
+    so a row stops being searched at its first hit. When `sigs` (one per column,
+    from `trigram_signatures`) is given, rows whose signature rules the needle out are skipped.
+    """
+    out = np.zeros(len(cols[0]), dtype=bool)
+    pending = rows
+    needle_sig = _trigram_signatures(pd.Series([needle]))[0] if sigs else np.uint64(0)
+    for i, col in enumerate(cols):
+        if not len(pending):
+            break
+        candidates = pending
+        if needle_sig:
+            candidates = pending[(sigs[i][pending] & needle_sig) == needle_sig]
+        if len(candidates) == len(col):
+            # Every row is a candidate: scan the column in place rather than copying it with take()
+            out |= pc.match_substring(pa.array(col), needle).to_numpy(zero_copy_only=False)
+        else:
+            hits = pc.match_substring(pa.array(col).take(candidates), needle).to_numpy(zero_copy_only=False)
+            out[candidates[hits]] = True
+        pending = pending[~out[pending]]
+    return out
+
+def _has_term(tokens: pd.Series, term: str) -> np.ndarray:
+    """Rows of a `_split_terms` column with a term equal to `term` (lowercase), ignoring case."""
+    arr = pa.array(tokens)
+    hits = pc.equal(pc.utf8_lower(pc.list_flatten(arr)), term).to_numpy(zero_copy_only=False)
+    out = np.zeros(len(arr), dtype=bool)
+    out[pc.list_parent_indices(arr).to_numpy()[hits]] = True
+    return out
+
+def apply_filters(
+    df: pd.DataFrame,
+    author_q: str,
+    content_q: str,
+    fields: List[str],
+    search_cols: Dict[str, pd.Series],
+    mesh_col: Optional[str] = None,
+    signatures: Optional[Dict[str, np.ndarray]] = None,
+) -> pd.DataFrame:
+    """
+    Filter rows by an author substring and a keyword matched in any of `fields`.
+    `signatures` (from `trigram_signatures`) lets the keyword scan skip rows that cannot match.
+    """
+    mask = np.ones(len(df), dtype=bool)
+
+    if author_q.strip():
+        mask &= _contains(search_cols[COL_AUTHORS], author_q.strip().lower())
+
+    if content_q.strip() and fields:
+        field_cols = {"Title": COL_TITLE, "Abstract": COL_ABS, "MeSH terms": mesh_col}
+        # Shortest fields first so the long Abstract column sees the fewest rows
+        order = ["Title", "MeSH terms", "Abstract"]
+        names = [field_cols[f] for f in order if f in fields and field_cols[f]]
+        if len(names) == sum(1 for c in field_cols.values() if c):
+            names = [BLOB_KEY]
+        if names:
+            cols = [search_cols[c] for c in names]
+            sigs = [signatures[c] for c in names] if signatures else None
+            mask = _any_contains(cols, content_q.lower(), np.flatnonzero(mask), sigs)
+
+    return df.loc[mask]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def csv_bytes(scope_id: int, mtime: float, _data: pd.DataFrame, columns: List[str]) -> bytes:
+    """CSV download payload for a filtered scope; only re-encoded when the scope or the file (`mtime`) changes."""
+    return _data.to_csv(columns=columns, index=False).encode("utf-8-sig")
+
+# -------------------------------------------------
+# Chat routing
+# -------------------------------------------------
+def _extract_top_n(text: str, default: int = 10) -> int:
+    m = TOP_N_RE.search(text)
+    if m:
+        return max(1, int(m.group(1)))
+    m2 = FIRST_NUM_RE.search(text)  # fallback: first number
+    return max(1, int(m2.group(1))) if m2 else default
+
+def _safe_series_counts(series: pd.Series, split_semicolon=True) -> pd.Series:
+    arr = pa.array(series.dropna().astype("string[pyarrow]"), type=pa.large_string())
+    if split_semicolon and len(arr) and pc.mean(pc.match_substring(arr, ";")).as_py() > 0.3:
+        arr = pc.utf8_trim_whitespace(pc.list_flatten(pc.split_pattern(arr, pattern=";")))
+    arr = pc.filter(arr, pc.not_equal(arr, ""))
+    return pd.Series(arr.to_pandas(), name=series.name).value_counts()
+
+def scope_id(data: pd.DataFrame) -> int:
+    """
+    Cheap fingerprint of which rows are in `data` (rows of the same loaded DataFrame).
+    It says nothing about which file was loaded, so caches keyed on it also take the CSV's mtime.
+    """
+    return hash((len(data), data.index.to_numpy().tobytes()))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def top_counts(scope_id: int, mtime: float, col_name: str, split_semicolon: bool, _data: pd.DataFrame) -> pd.Series:
+    """Full value counts of `col_name` over `_data`, cached per scope so repeated 'top N' asks are a slice."""
+    return _safe_series_counts(_data[col_name], split_semicolon=split_semicolon)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def top_term_counts(scope_id: int, mtime: float, key: str, _search_cols: Dict[str, pd.Series], _data: pd.DataFrame) -> pd.Series:
+    """Like `top_counts`, for the pre-split `_search_cols[key]` term lists restricted to the rows of `_data`."""
+    tokens = _search_cols[key]
+    rows = tokens.index.get_indexer(_data.index)
+    terms = pc.list_flatten(pa.array(tokens).take(rows))
+    vc = pc.value_counts(pc.filter(terms, pc.not_equal(terms, "")))
+    counts = pd.Series(vc.field("counts").to_numpy(), index=vc.field("values").to_pandas())
+    return counts.sort_values(ascending=False, kind="stable")
+
+Reply = Tuple[str, Optional[pd.DataFrame]]
+
+def _h_clear(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    st.session_state.messages = []
+    return "Chat cleared.", None
+
+def _h_help(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    return (
+        "You can ask things like:\n"
+        "- **how many rows?** or **how many matches?**\n"
+        "- **top 10 authors** / **top institutions 5**\n"
+        "- **top mesh terms 5**\n"
+        "- **list titles** (optionally: **list titles mentioning ketamine** or **list titles tagged humans**)\n"
+        "- **what columns are available?**\n"
+        "- **summary** (basic dataset summary)\n"
+        "- **clear chat**",
+        None,
+    )
+
+def _h_row_count(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    return f"There are **{len(data):,}** rows in the current scope.", None
+
+def _h_columns(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    cols = ", ".join(map(str, data.columns))
+    return f"Available columns:\n\n{cols}", None
+
+def _h_summary(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    text = (
+        f"- Rows: **{len(data):,}**\n"
+        f"- Columns: **{data.shape[1]}**\n"
+        f"- Example columns: {', '.join(map(str, data.columns[:10]))}"
+    )
+    return text, None
+
+def _h_top_authors(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    n = _extract_top_n(q_lower, default=10)
+    if COL_AUTHORS in data.columns:
+        vc = top_term_counts(scope_id(data), mtime, AUTHOR_TOKENS_KEY, search_cols, data).head(n)
+        df_out = vc.reset_index()
+        df_out.columns = ["Author", "Count"]
+        return f"Top {len(df_out)} authors:", df_out
+    return "I couldn't find the Authors column.", None
+
+def _h_top_institutions(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    # try to guess a likely column
+    inst_col = next((c for c in data.columns if c.lower() in {"institution", "institutions", "affiliation", "affiliations", "organization", "organizations"}), None)
+    if inst_col:
+        n = _extract_top_n(q_lower, default=10)
+        vc = top_counts(scope_id(data), mtime, inst_col, True, data).head(n)
+        df_out = vc.reset_index()
+        df_out.columns = ["Institution", "Count"]
+        return f"Top {len(df_out)} institutions:", df_out
+    return "I couldn't find an Institution/Affiliation column.", None
+
+def _h_top_mesh(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    if MESH_TOKENS_KEY not in search_cols:
+        return "I couldn't find a MeSH terms column.", None
+    n = _extract_top_n(q_lower, default=10)
+    vc = top_term_counts(scope_id(data), mtime, MESH_TOKENS_KEY, search_cols, data).head(n)
+    df_out = vc.reset_index()
+    df_out.columns = ["MeSH term", "Count"]
+    return f"Top {len(df_out)} MeSH terms:", df_out
+
+def _h_list_titles(
+    q_lower: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]],
+) -> Reply:
+    # optionally filtered by a word, or by an exact MeSH term
+    word_match = MENTIONING_RE.search(q_lower)
+    tag_match = TAGGED_RE.search(q_lower)
+    sub = data
+    if tag_match and MESH_TOKENS_KEY not in search_cols:
+        return "I couldn't find a MeSH terms column.", None
+    if tag_match:
+        tokens = search_cols[MESH_TOKENS_KEY]
+        rows = tokens.index.get_indexer(sub.index)
+        sub = sub[_has_term(tokens, tag_match.group(1).strip())[rows]]
+    elif word_match and COL_TITLE in data.columns:
+        kw = word_match.group(1).strip()
+        titles = search_cols[COL_TITLE]
+        rows = titles.index.get_indexer(sub.index)
+        sigs = [signatures[COL_TITLE]] if signatures else None
+        sub = sub[_any_contains([titles], kw.lower(), rows, sigs)[rows]]
+    if COL_TITLE in sub.columns:
+        df_out = sub[[COL_TITLE]].head(200).copy()
+        return f"Here are up to {len(df_out)} titles:", df_out
+    return "I couldn't find the Title column.", None
+
+# Intent table, tried in order against the lowercased, stripped question.
+# "A and B" conditions are lookaheads so each word may appear anywhere.
+ROUTES: List[Tuple["re.Pattern[str]", Callable[..., Reply]]] = [
+    (re.compile(r"^(?:clear|clear chat|reset)\Z"), _h_clear),
+    (re.compile(r"help|what can you do|commands|options"), _h_help),
+    (re.compile(r"(?s)^(?=.*how many)(?=.*(?:row|match))"), _h_row_count),
+    (re.compile(r"(?s)^(?=.*column)(?=.*(?:what|list|available))"), _h_columns),
+    (re.compile(r"summary"), _h_summary),
+    (re.compile(r"(?s)^(?=.*top)(?=.*author)"), _h_top_authors),
+    (re.compile(r"(?s)^(?=.*top)(?=.*(?:institution|affiliation|organization))"), _h_top_institutions),
+    (re.compile(r"(?s)^(?=.*top)(?=.*(?:mesh|keyword))"), _h_top_mesh),
+    (re.compile(r"(?s)^(?=.*list)(?=.*title)"), _h_list_titles),
+]
+
+def route_query(
+    q: str,
+    data: pd.DataFrame,
+    mtime: float,
+    search_cols: Dict[str, pd.Series],
+    signatures: Optional[Dict[str, np.ndarray]] = None,
+) -> Reply:
+    """
+    Very lightweight intent routing for common dataset Q&A.
+    `mtime` is the loaded CSV's mtime (keys the per-scope count caches);
+    `search_cols` / `signatures` are the `search_columns` / `trigram_signatures` of the full dataset.
+    Returns (text_response, optional_dataframe_to_show)
+    """
+    q_lower = q.lower().strip()
+
+    for pattern, handler in ROUTES:
+        if pattern.search(q_lower):
+            return handler(q_lower, data, mtime, search_cols, signatures)
+
+    # Fallback
+    return (
+        "Sorry, I didn't recognize that. Try: **how many matches**, **top 10 authors**, "
+        "**top institutions 5**, **top mesh terms**, **list titles**, **what columns are available** or **summary**. "
+        "Type **clear chat** to reset.",
+        None,
+    )